@@ -0,0 +1,115 @@
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import click
+import numpy as np
+
+
+def _get(conn, path, headers=None):
+    conn.request("GET", path, headers=headers or {})
+    response = conn.getresponse()
+    body = response.read()
+    return response.status, response.getheader("ETag"), body
+
+
+def _client(url, paths, num_requests, conditional, seed, results):
+    """Send `num_requests` random requests over one keep-alive connection"""
+    rng = random.Random(seed)
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port)
+    etags = {}
+    for _ in range(num_requests):
+        endpoint, path = rng.choice(paths)
+        headers = {"Accept-Encoding": "gzip"}
+        if conditional and path in etags:
+            headers["If-None-Match"] = etags[path]
+        start = time.perf_counter()
+        status, etag, body = _get(conn, path, headers)
+        latency = time.perf_counter() - start
+        etags[path] = etag
+        results.append((endpoint, status, latency, len(body)))
+    conn.close()
+
+
+@click.command()
+@click.option("--url", default="http://localhost:14859", help="URL of the API")
+@click.option("--clients", default=16, help="Number of concurrent clients")
+@click.option("--requests", "num_requests", default=200, help="Requests per client")
+@click.option("--neighbours", default=10, help="Size of the connectivity submatrix")
+@click.option(
+    "--conditional/--no-conditional",
+    default=False,
+    help="Send If-None-Match with the last ETag (simulates client caches)",
+)
+def run(url, clients, num_requests, neighbours, conditional):
+    """Load test the connectivity API with concurrent clients, report latencies"""
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port)
+    _, _, body = _get(conn, "/sites")
+    conn.close()
+    site_ids = [site["localityNo"] for site in json.loads(body)]
+
+    # Mix of requests, as made by a dashboard
+    paths = []
+    for locality_id in site_ids:
+        paths += [
+            ("neighbours", f"/neighbours/{locality_id}?n={neighbours}"),
+            ("connectivity", f"/connectivity/{locality_id}?n={neighbours}"),
+            (
+                "connectivity (binary)",
+                f"/connectivity/{locality_id}?n={neighbours}&format=binary",
+            ),
+            ("tracks", f"/tracks/{locality_id}"),
+            ("tracks (binary)", f"/tracks/{locality_id}?format=binary"),
+        ]
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=_client,
+            args=(url, paths, num_requests, conditional, seed, results),
+        )
+        for seed in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    by_endpoint = defaultdict(list)
+    for endpoint, status, latency, size in results:
+        by_endpoint[endpoint].append((status, latency, size))
+        by_endpoint["all"].append((status, latency, size))
+
+    print(
+        f"{len(results)} requests from {clients} clients in {duration:.2f} s "
+        f"({len(results) / duration:.0f} requests/s)"
+    )
+    print(
+        f"{'endpoint':<24}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        f"{'avg kB':>10}{'304':>8}{'errors':>8}"
+    )
+    for endpoint, values in by_endpoint.items():
+        statuses = np.array([v[0] for v in values])
+        latencies = 1000 * np.array([v[1] for v in values])
+        sizes = np.array([v[2] for v in values]) / 1000
+        print(
+            f"{endpoint:<24}{len(values):>8}"
+            f"{np.percentile(latencies, 50):>10.2f}"
+            f"{np.percentile(latencies, 99):>10.2f}"
+            f"{latencies.max():>10.2f}"
+            f"{sizes.mean():>10.1f}"
+            f"{(statuses == 304).sum():>8}"
+            f"{(statuses >= 400).sum():>8}"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,358 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import click
+import numpy as np
+import pandas as pd
+import xarray as xr
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AQUA_SITE_FILE = os.getenv("AQUA_SITE_FILE")
+AQUA_SITE_DISTANCES_FILES = os.getenv("AQUA_SITE_DISTANCES_FILES")
+AQUA_CONNECTIVITY_FILE_WITH_LOCALITY_ID = os.getenv(
+    "AQUA_CONNECTIVITY_FILE_WITH_LOCALITY_ID"
+)
+AQUA_OPENDRIFT_OUTPUT_FILE = os.getenv("AQUA_OPENDRIFT_OUTPUT_FILE")
+AQUA_API_RELOAD_INTERVAL_SECONDS = int(
+    os.getenv("AQUA_API_RELOAD_INTERVAL_SECONDS", 60)
+)
+
+MAX_NEIGHBOURS = 50
+COORDINATE_DECIMALS = 5  # ~1 m
+CONNECTIVITY_DECIMALS = 3  # %
+
+
+def _remote_version(url):
+    """ETag (or Last-Modified) of a remote file, from a HEAD request"""
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+
+def _data_version(files):
+    """Hash of name, mtime and size of local files and the ETag of remote (HTTP) files"""
+    keys = []
+    for filename in files:
+        if filename and os.path.exists(filename):
+            stat = os.stat(filename)
+            keys.append(f"{filename}:{stat.st_mtime_ns}:{stat.st_size}")
+        elif filename and filename.startswith(("http://", "https://")):
+            keys.append(f"{filename}:{_remote_version(filename)}")
+        else:
+            keys.append(str(filename))
+    return hashlib.md5("|".join(keys).encode()).hexdigest()[:16]
+
+
+class ConnectivityData:
+    """Connectivity matrix, neighbour index and origin-indexed trajectories, in memory
+
+    All lookups are done on immutable numpy arrays and pre-encoded responses, so one
+    instance can serve any number of threads. A reload builds a new instance.
+    """
+
+    def __init__(self, site_file, distances_file, connectivity_file, trajectory_file):
+        self.version = _data_version(
+            [site_file, distances_file, connectivity_file, trajectory_file]
+        )
+        print(f"Loading data (version {self.version})...")
+
+        df_locs = pd.read_excel(site_file, index_col=0).set_index("localityNo")
+        self.sites = [
+            {
+                "localityNo": int(locality_id),
+                "name": row["name"],
+                "lon": float(row["lon"]),
+                "lat": float(row["lat"]),
+            }
+            for locality_id, row in df_locs.iterrows()
+        ]
+        self.names = df_locs["name"].to_dict()
+
+        # Neighbour index: for each site, the MAX_NEIGHBOURS closest sites (incl. itself)
+        df_dists = pd.read_excel(distances_file, index_col=0)
+        dists = df_dists.values
+        order = np.argsort(dists, axis=1)[:, :MAX_NEIGHBOURS]
+        neighbour_ids = df_dists.columns.values[order]
+        neighbour_dists = np.take_along_axis(dists, order, axis=1)
+        self.neighbours = {
+            int(locality_id): (neighbour_ids[i].astype(int), neighbour_dists[i])
+            for i, locality_id in enumerate(df_dists.index)
+        }
+
+        # Connectivity matrix (%), receiving sites as rows and sources as columns
+        df_connect = pd.read_excel(connectivity_file, index_col=0)
+        df_connect = df_connect.reindex(columns=df_connect.index).fillna(0)
+        self.connectivity = df_connect.values.astype(np.float32)
+        self.connectivity_index = {
+            int(locality_id): i for i, locality_id in enumerate(df_connect.index)
+        }
+
+        # Trajectories, pre-encoded per origin
+        self.tracks_geojson = {}
+        self.tracks_geojson_gzip = {}
+        self.tracks_binary = {}
+        if trajectory_file:
+            self._load_tracks(trajectory_file)
+
+    def _load_tracks(self, trajectory_file):
+        engine = "zarr" if trajectory_file.rstrip("/").endswith(".zarr") else None
+        with xr.open_dataset(trajectory_file, engine=engine) as ds:
+            lons = ds.lon.values
+            lats = ds.lat.values
+            active = (ds.status.values == 0) & np.isfinite(lons) & np.isfinite(lats)
+            origins = ds.origin_marker.values[:, 0]
+
+        for origin in np.unique(origins[np.isfinite(origins)]):
+            features = []
+            lengths = []
+            coordinates = []
+            for t in np.flatnonzero(origins == origin):
+                coords = np.round(
+                    np.column_stack([lons[t][active[t]], lats[t][active[t]]]),
+                    COORDINATE_DECIMALS,
+                )
+                features.append(
+                    {
+                        "type": "Feature",
+                        "geometry": {
+                            "type": "LineString",
+                            "coordinates": coords.tolist(),
+                        },
+                        "properties": {"trajectory": int(t), "origin": int(origin)},
+                    }
+                )
+                lengths.append(len(coords))
+                coordinates.append(coords.astype("<f4"))
+            self.tracks_geojson[int(origin)] = json.dumps(
+                {"type": "FeatureCollection", "features": features},
+                separators=(",", ":"),
+            ).encode()
+            self.tracks_geojson_gzip[int(origin)] = gzip.compress(
+                self.tracks_geojson[int(origin)]
+            )
+            # Binary: uint32 number of tracks, uint32 number of points per track,
+            # followed by float32 (lon, lat) pairs of all tracks, little endian
+            self.tracks_binary[int(origin)] = (
+                struct.pack("<I", len(lengths))
+                + np.asarray(lengths, dtype="<u4").tobytes()
+                + b"".join(c.tobytes() for c in coordinates)
+            )
+
+    def get_neighbours(self, locality_id, n=10):
+        ids, dists = self.neighbours[locality_id]
+        return [
+            {
+                "localityNo": int(i),
+                "name": self.names.get(i),
+                "distance": float(d),
+            }
+            for i, d in zip(ids[:n], dists[:n])
+        ]
+
+    def get_submatrix(self, locality_ids):
+        """Connectivity between the given sites (receivers as rows, sources as columns)"""
+        idx = [self.connectivity_index[i] for i in locality_ids]
+        return self.connectivity[np.ix_(idx, idx)]
+
+
+class DataStore:
+    """Holds the current ConnectivityData and reloads it when the input files change"""
+
+    def __init__(self, files, reload_interval):
+        self.files = files
+        self.reload_interval = reload_interval
+        self.data = ConnectivityData(*files)
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self):
+        if time.monotonic() - self._checked > self.reload_interval:
+            if self._lock.acquire(blocking=False):
+                threading.Thread(target=self._reload, daemon=True).start()
+        return self.data
+
+    def _reload(self):
+        try:
+            # Cheap check before loading everything again
+            if _data_version(self.files) != self.data.version:
+                self.data = ConnectivityData(*self.files)
+        except Exception as e:
+            print(f"Reload error: {e}")
+        finally:
+            self._checked = time.monotonic()
+            self._lock.release()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Read-only JSON/GeoJSON/binary API
+
+    GET /sites
+    GET /neighbours/<localityNo>?n=10
+    GET /connectivity/<localityNo>?n=10[&format=binary]  (submatrix of the n nearest sites)
+    GET /connectivity?sites=<localityNo>,<localityNo>,...[&format=binary]
+    GET /tracks/<localityNo>[?format=binary]
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid delayed ACKs on keep-alive
+    disable_nagle_algorithm = True
+    store = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _gzip(self, body, content_type="application/json", body_gzip=None):
+        """Whether to gzip the response: the client accepts it and it is worth it"""
+        if "gzip" not in self.headers.get("Accept-Encoding", ""):
+            return False
+        return body_gzip is not None or (
+            len(body) > 1024 and content_type != "application/octet-stream"
+        )
+
+    def _send(
+        self,
+        status,
+        body=b"",
+        content_type="application/json",
+        headers=None,
+        body_gzip=None,
+    ):
+        """Send response, gzip compressed if the client accepts it and it is worth it"""
+        if self._gzip(body, content_type, body_gzip):
+            if body_gzip is None:
+                body_gzip = gzip.compress(body, compresslevel=1)
+            body = body_gzip
+            headers = dict(headers or {}, **{"Content-Encoding": "gzip"})
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, status=200):
+        return {
+            "status": status,
+            "body": json.dumps(obj, separators=(",", ":")).encode(),
+        }
+
+    def _error(self, status, message):
+        return self._json({"error": message}, status=status)
+
+    def _neighbour_count(self, query):
+        n = int(query.get("n", [10])[0])
+        if not 1 <= n <= MAX_NEIGHBOURS:
+            raise ValueError(f"n must be between 1 and {MAX_NEIGHBOURS}")
+        return n
+
+    def _route(self, data, url, query):
+        """Resolve the request to the keyword arguments of `_send`"""
+        binary = query.get("format", [""])[0] == "binary"
+        try:
+            if url.path == "/sites":
+                return self._json(data.sites)
+            elif m := re.fullmatch(r"/neighbours/(\d+)", url.path):
+                n = self._neighbour_count(query)
+                return self._json(data.get_neighbours(int(m.group(1)), n=n))
+            elif m := re.fullmatch(r"/connectivity(?:/(\d+))?", url.path):
+                if m.group(1) is not None:
+                    n = self._neighbour_count(query)
+                    ids, _ = data.neighbours[int(m.group(1))]
+                    locality_ids = [int(i) for i in ids[:n]]
+                else:
+                    sites = query.get("sites", [""])[0]
+                    locality_ids = [int(i) for i in sites.split(",")]
+                values = data.get_submatrix(locality_ids)
+                if binary:
+                    # float32 row-major, receivers as rows, sites listed in X-Sites
+                    return {
+                        "status": 200,
+                        "body": values.astype("<f4").tobytes(),
+                        "content_type": "application/octet-stream",
+                        "headers": {"X-Sites": ",".join(map(str, locality_ids))},
+                    }
+                # float64 and rounded, float32 values print with ~16 digits in JSON
+                values = np.round(values.astype(float), CONNECTIVITY_DECIMALS)
+                return self._json({"sites": locality_ids, "values": values.tolist()})
+            elif m := re.fullmatch(r"/tracks/(\d+)", url.path):
+                locality_id = int(m.group(1))
+                if binary:
+                    return {
+                        "status": 200,
+                        "body": data.tracks_binary[locality_id],
+                        "content_type": "application/octet-stream",
+                    }
+                return {
+                    "status": 200,
+                    "body": data.tracks_geojson[locality_id],
+                    "content_type": "application/geo+json",
+                    "body_gzip": data.tracks_geojson_gzip[locality_id],
+                }
+            elif url.path == "/health":
+                return self._json({"version": data.version})
+            else:
+                return self._error(404, f"Unknown path '{url.path}'")
+        except KeyError as e:
+            return self._error(404, f"Unknown site {e}")
+        except (ValueError, IndexError) as e:
+            return self._error(400, f"Bad request: {e}")
+
+    def do_GET(self):
+        data = self.store.get()
+        url = urlparse(self.path)
+        response = self._route(data, url, parse_qs(url.query))
+        if response["status"] != 200 or url.path == "/health":
+            self._send(**response)
+            return
+
+        # Conditional GET: all responses change only when the data is reloaded. The gzip
+        # and uncompressed bodies differ, so each encoding has its own (strong) ETag.
+        gzipped = self._gzip(
+            response["body"],
+            response.get("content_type", "application/json"),
+            response.get("body_gzip"),
+        )
+        cache_headers = {
+            "ETag": f'"{data.version}-gz"' if gzipped else f'"{data.version}"',
+            "Cache-Control": "max-age=60",
+            "Vary": "Accept-Encoding",
+        }
+        if self.headers.get("If-None-Match") == cache_headers["ETag"]:
+            self._send(304, headers=cache_headers)
+            return
+        response["headers"] = dict(response.get("headers", {}), **cache_headers)
+        self._send(**response)
+
+
+@click.command()
+@click.option("--host", default="0.0.0.0", help="Address to listen on")
+@click.option("--port", default=14859, help="Port to listen on")
+def run(host, port):
+    RequestHandler.store = DataStore(
+        [
+            AQUA_SITE_FILE,
+            AQUA_SITE_DISTANCES_FILES,
+            AQUA_CONNECTIVITY_FILE_WITH_LOCALITY_ID,
+            AQUA_OPENDRIFT_OUTPUT_FILE,
+        ],
+        reload_interval=AQUA_API_RELOAD_INTERVAL_SECONDS,
+    )
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    print(f"Serving on http://{host}:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    run()
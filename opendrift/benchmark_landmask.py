@@ -0,0 +1,136 @@
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import click
+import numpy as np
+import pandas as pd
+from opendrift.models.sedimentdrift import OceanDrift
+from opendrift.readers import reader_global_landmask
+
+from runnorkystforecast import (
+    RegionalLandmaskReader,
+    _landmask_region,
+    prepare_regional_landmask,
+)
+
+LANDMASKS = ["global", "regional"]
+TIME_STEP_SECONDS = 600
+
+
+def benchmark_run(df_locs, landmask_file, particles_per_site, hours) -> dict:
+    """Run a drift simulation with synthetic currents, return the time per model step
+
+    The constant current pushes many elements onto the coast, so the landmask is checked
+    (and `previous` applied) on every step. No ocean model data is needed.
+    """
+    o = OceanDrift(loglevel=50)
+    o.set_config("environment:fallback:x_sea_water_velocity", 0.2)
+    o.set_config("environment:fallback:y_sea_water_velocity", 0.1)
+    o.set_config("general:coastline_action", "previous")
+    if landmask_file is not None:
+        o.set_config("general:use_auto_landmask", False)
+        o.add_reader(RegionalLandmaskReader(landmask_file))
+
+    np.random.seed(0)
+    starttime = datetime(2025, 1, 1)
+    for _, row in df_locs.iterrows():
+        o.seed_elements(
+            lon=row["lon"],
+            lat=row["lat"],
+            radius=10,
+            number=particles_per_site,
+            origin_marker=row["localityNo"],
+            time=starttime,
+        )
+
+    t0 = time.perf_counter()
+    o.run(duration=timedelta(hours=hours), time_step=TIME_STEP_SECONDS)
+    run_seconds = time.perf_counter() - t0
+
+    num_steps = hours * 3600 // TIME_STEP_SECONDS
+    reader_name = "global_landmask" if landmask_file is None else "regional_landmask"
+    landmask_seconds = o.env.timing[f"main loop:readers:{reader_name}"].total_seconds()
+    return {
+        "step_ms": 1000 * run_seconds / num_steps,
+        "landmask_step_ms": 1000 * landmask_seconds / num_steps,
+    }
+
+
+def mask_agreement(df_locs, landmask_file, margin_km, num_points=1_000_000) -> float:
+    """Fraction of random points in the region where both landmasks agree"""
+    lonmin, latmin, lonmax, latmax = _landmask_region(df_locs, margin_km)
+    rng = np.random.default_rng(0)
+    lons = rng.uniform(lonmin, lonmax, num_points)
+    lats = rng.uniform(latmin, latmax, num_points)
+    land_global = reader_global_landmask.get_mask().contains_many(lons, lats)
+    land_regional = RegionalLandmaskReader(landmask_file).get_variables(
+        ["land_binary_mask"], x=lons, y=lats, z=np.zeros(num_points)
+    )["land_binary_mask"]
+    return float(np.mean(land_global == land_regional))
+
+
+@click.command()
+@click.argument("sitefile")
+@click.option("--particles-per-site", default=100, help="Elements seeded per site")
+@click.option("--hours", default=12, help="Simulation duration (hours)")
+@click.option("--resolution-meters", default=50, help="Resolution of the regional mask")
+@click.option("--margin-km", default=20.0, help="Margin around the sites (km)")
+@click.option("--repeat", default=3, help="Number of timed runs per landmask")
+def run(sitefile, particles_per_site, hours, resolution_meters, margin_km, repeat):
+    """Compare the time per model step with the global and a regional landmask
+
+    SITEFILE is the site list (e.g. AQUA_SITE_FILE).
+    """
+    df_locs = pd.read_excel(sitefile)
+
+    t0 = time.perf_counter()
+    reader_global_landmask.get_mask()
+    print(f"Global landmask loaded in {time.perf_counter() - t0:.2f} s")
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        t0 = time.perf_counter()
+        landmask_file = prepare_regional_landmask(
+            df_locs, resolution_meters, margin_km, cache_dir
+        )
+        print(f"Regional landmask rasterized in {time.perf_counter() - t0:.2f} s")
+        t0 = time.perf_counter()
+        RegionalLandmaskReader(landmask_file)
+        print(f"Regional landmask loaded in {time.perf_counter() - t0:.2f} s")
+        agreement = mask_agreement(df_locs, landmask_file, margin_km)
+
+        results = {}
+        for landmask in LANDMASKS:
+            print(f"Benchmarking '{landmask}' landmask...")
+            runs = [
+                benchmark_run(
+                    df_locs,
+                    landmask_file if landmask == "regional" else None,
+                    particles_per_site,
+                    hours,
+                )
+                for _ in range(repeat)
+            ]
+            results[landmask] = {
+                key: min(r[key] for r in runs) for key in runs[0].keys()
+            }
+    finally:
+        shutil.rmtree(cache_dir)
+
+    print(
+        f"{len(df_locs) * particles_per_site} elements, "
+        f"{hours * 3600 // TIME_STEP_SECONDS} steps"
+    )
+    print(f"{'':<22}" + "".join(f"{landmask:>14}" for landmask in LANDMASKS))
+    for key in results["global"].keys():
+        print(
+            f"{key:<22}"
+            + "".join(f"{results[landmask][key]:>14.4g}" for landmask in LANDMASKS)
+        )
+    print(f"Agreement of the landmasks within the region: {100 * agreement:.3f}%")
+
+
+if __name__ == "__main__":
+    run()
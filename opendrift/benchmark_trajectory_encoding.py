@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import time
+
+import click
+import numpy as np
+import xarray as xr
+
+from runnorkystforecast import TRAJECTORY_LONLAT_SCALE_FACTOR, _write_trajectories_zarr
+
+ENCODINGS = ["default", "compact"]
+# Documented max. abs. error of lon/lat (degrees), with some slack for float64 rounding
+MAX_ABS_ERRORS = {"default": 0.0, "compact": TRAJECTORY_LONLAT_SCALE_FACTOR / 2 * 1.001}
+VARIABLES = ["lon", "lat", "status", "origin_marker"]
+
+
+def _store_size(path: str) -> int:
+    """Total size of all files in a (local) zarr store in bytes"""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+def _read_variables(path: str) -> xr.Dataset:
+    """Read and decode the variables used by the dashboard"""
+    with xr.open_dataset(path, engine="zarr") as ds:
+        return ds[VARIABLES].load()
+
+
+def benchmark_encoding(ds: xr.Dataset, path: str, encoding: str, repeat: int) -> dict:
+    t0 = time.perf_counter()
+    _write_trajectories_zarr(ds, path, encoding=encoding)
+    write_seconds = time.perf_counter() - t0
+
+    read_seconds = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ds_read = _read_variables(path)
+        read_seconds.append(time.perf_counter() - t0)
+    decoded_bytes = sum(ds_read[name].nbytes for name in VARIABLES)
+
+    max_errors = {}
+    for name in ["lon", "lat"]:
+        max_errors[name] = float(np.nanmax(np.abs(ds_read[name] - ds[name])))
+
+    return {
+        "size_bytes": _store_size(path),
+        "write_seconds": write_seconds,
+        "read_seconds": min(read_seconds),
+        "read_mb_per_second": decoded_bytes / 1e6 / min(read_seconds),
+        "max_abs_error_lon": max_errors["lon"],
+        "max_abs_error_lat": max_errors["lat"],
+    }
+
+
+@click.command()
+@click.argument("ncfile", type=click.Path(exists=True))
+@click.option("--repeat", default=5, help="Number of timed reads per encoding")
+def run(ncfile, repeat):
+    """Compare size and read/decode throughput of the trajectory zarr encodings
+
+    NCFILE is an OpenDrift trajectory output file (e.g. AQUA_OPENDRIFT_OUTPUT_FILE).
+    """
+    ds = xr.open_dataset(ncfile)
+    ds[VARIABLES].load()
+    workdir = tempfile.mkdtemp()
+    try:
+        results = {}
+        for encoding in ENCODINGS:
+            print(f"Benchmarking '{encoding}' encoding...")
+            results[encoding] = benchmark_encoding(
+                ds, os.path.join(workdir, f"{encoding}.zarr"), encoding, repeat
+            )
+    finally:
+        ds.close()
+        shutil.rmtree(workdir)
+
+    print(f"{'':<22}" + "".join(f"{encoding:>14}" for encoding in ENCODINGS))
+    for key in results["default"].keys():
+        print(
+            f"{key:<22}"
+            + "".join(f"{results[encoding][key]:>14.4g}" for encoding in ENCODINGS)
+        )
+    ratio = results["default"]["size_bytes"] / results["compact"]["size_bytes"]
+    print(f"Compression ratio (default/compact): {ratio:.2f}")
+
+    for encoding in ENCODINGS:
+        for name in ["lon", "lat"]:
+            error = results[encoding][f"max_abs_error_{name}"]
+            if error > MAX_ABS_ERRORS[encoding]:
+                raise click.ClickException(
+                    f"Max. abs. error of {name} with '{encoding}' encoding is {error:.3g} "
+                    f"degrees, documented is {MAX_ABS_ERRORS[encoding]:.3g}"
+                )
+
+
+if __name__ == "__main__":
+    run()
@@ -5,6 +5,7 @@ from typing import Dict
 
 import click
 import fsspec
+import numpy as np
 import pandas as pd
 import pyproj
 import toml
@@ -12,12 +13,14 @@ import xarray as xr
 from dotenv import load_dotenv
 from minio import Minio
 from opendrift.models.sedimentdrift import OceanDrift
-from opendrift.readers import reader_netCDF_CF_generic
+from opendrift.readers import reader_global_landmask, reader_netCDF_CF_generic
+from opendrift.readers.basereader.continuous import ContinuousReader
 from tqdm import tqdm
 
 load_dotenv()
 
 OPENDRIFT_LOGLEVEL = 20  # Info output (0: debug, 50: no output)
+TRAJECTORY_LONLAT_SCALE_FACTOR = 1e-5  # degrees, ~1.1 m in latitude
 
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
@@ -39,6 +42,10 @@ def _load_config_from_env() -> Dict:
                 os.getenv("AQUA_OPENDRIFT_SIMULATION_DURATION_HOURS")
             ),
             "output_file": os.getenv("AQUA_OPENDRIFT_OUTPUT_FILE"),
+            "time_step_output": int(
+                os.getenv("AQUA_OPENDRIFT_TIME_STEP_OUTPUT_SECONDS", 600)
+            ),
+            "output_encoding": os.getenv("AQUA_OPENDRIFT_OUTPUT_ENCODING", "default"),
             "output_file_s3": "s3://%s/%s"
             % (AWS_BUCKET_NAME, os.getenv("AQUA_OPENDRIFT_OUTPUT_FILE_S3")),
         },
@@ -47,6 +54,8 @@ def _load_config_from_env() -> Dict:
                 os.getenv("AQUA_CONNECTIVITY_NUMBER_OF_NEIGHBOURS")
             ),
             "radius": int(os.getenv("AQUA_CONNECTIVITY_RADIUS")),
+            "inline": os.getenv("AQUA_CONNECTIVITY_INLINE", "false").lower()
+            in ("1", "true", "yes"),
             "output_file": os.getenv("AQUA_CONNECTIVITY_OUTPUT_FILE"),
             "output_file_withLocalityId": os.getenv(
                 "AQUA_CONNECTIVITY_OUTPUT_FILE_WITH_LOCALITY_ID"
@@ -59,17 +68,293 @@ def _load_config_from_env() -> Dict:
                 os.getenv("AQUA_CONNECTIVITY_OUTPUT_FILE_WITH_LOCALITY_ID_S3"),
             ),
         },
+        "archive": {
+            "output_dir": os.getenv("AQUA_ARCHIVE_DIR", "modeloutput/archive"),
+            "output_s3": (
+                "s3://%s/%s" % (AWS_BUCKET_NAME, os.getenv("AQUA_ARCHIVE_S3"))
+                if os.getenv("AQUA_ARCHIVE_S3")
+                else None
+            ),
+            "tracks": os.getenv("AQUA_ARCHIVE_TRACKS", "false").lower()
+            in ("1", "true", "yes"),
+            "tracks_interval_seconds": int(
+                os.getenv("AQUA_ARCHIVE_TRACKS_INTERVAL_SECONDS", 3600)
+            ),
+        },
+        "landmask": {
+            "regional": os.getenv("AQUA_LANDMASK_REGIONAL", "false").lower()
+            in ("1", "true", "yes"),
+            "resolution_meters": int(os.getenv("AQUA_LANDMASK_RESOLUTION_METERS", 50)),
+            "margin_km": float(os.getenv("AQUA_LANDMASK_MARGIN_KM", 20)),
+            "cache_dir": os.getenv("AQUA_LANDMASK_CACHE_DIR", "modeloutput/landmask"),
+        },
     }
+    if not config["connectivity"]["inline"] and not config["opendrift"]["output_file"]:
+        raise ValueError(
+            "AQUA_OPENDRIFT_OUTPUT_FILE is required to calculate connectivity from the "
+            "trajectories, set it or set AQUA_CONNECTIVITY_INLINE=true"
+        )
+    if (
+        not config["connectivity"]["inline"]
+        and config["opendrift"]["time_step_output"] != 600
+    ):
+        # The connectivity from the trajectories would be based on the decimated output
+        raise ValueError(
+            "AQUA_OPENDRIFT_TIME_STEP_OUTPUT_SECONDS must be 600 (the model time step) "
+            "to calculate connectivity from the trajectories, set it to 600 or set "
+            "AQUA_CONNECTIVITY_INLINE=true"
+        )
     return config
 
 
-def run_opendrift(config, df_locs, starttime):
-    """Run OpenDrift forecast from all localities"""
+class ConnectivityOceanDrift(OceanDrift):
+    """OceanDrift model that accumulates site connectivity while the simulation runs
+
+    Same approach as `calculate_distance_connectivity_nearest`, but hits are counted from
+    the active elements before every model update, so the trajectories do not have to be
+    written to and read back from file.
+    """
+
+    def __init__(self, df_sites, df_dists, min_dist, num_sites=10, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connectivity_min_dist = min_dist
+        self.connectivity_site_ids = df_sites["localityNo"].values
+        self.connectivity_site_lons = df_sites["lon"].values
+        self.connectivity_site_lats = df_sites["lat"].values
+        # Only consider trajectories from the N nearest sites to each receiving site
+        self.connectivity_neighbours = [
+            df_dists[locality_id].sort_values(ascending=True).index[:num_sites].values
+            for locality_id in self.connectivity_site_ids
+        ]
+        # Cheap bounding box (in degrees) to skip elements far away from a site
+        self.connectivity_dlat = 1.5 * min_dist / 111e3
+        self.connectivity_dlon = self.connectivity_dlat / np.cos(
+            np.deg2rad(self.connectivity_site_lats)
+        )
+        self.connectivity_geod = pyproj.Geod(ellps="WGS84")
+        # hits[i, j] is True if element j has passed within min_dist of site i
+        self.connectivity_hits = np.zeros(
+            (len(self.connectivity_site_ids), 0), dtype=bool
+        )
+        self.connectivity_origin = np.zeros(0, dtype=np.int64)
+
+    def update(self):
+        self.accumulate_connectivity()
+        super().update()
+
+    def accumulate_connectivity(self):
+        """Register all active elements that are within min_dist of a site"""
+        if self.num_elements_active() == 0:
+            return
+
+        # Grow hit matrix if new elements have been seeded
+        num_elements = self.num_elements_total()
+        if self.connectivity_hits.shape[1] < num_elements:
+            grow = num_elements - self.connectivity_hits.shape[1]
+            self.connectivity_hits = np.pad(self.connectivity_hits, ((0, 0), (0, grow)))
+            self.connectivity_origin = np.pad(self.connectivity_origin, (0, grow))
+
+        idx = self.elements.ID
+        lons = self.elements.lon
+        lats = self.elements.lat
+        origins = self.elements.origin_marker
+        self.connectivity_origin[idx] = origins
+
+        for i, (lon, lat) in enumerate(
+            zip(self.connectivity_site_lons, self.connectivity_site_lats)
+        ):
+            candidates = (
+                (np.abs(lats - lat) < self.connectivity_dlat)
+                & (np.abs(lons - lon) < self.connectivity_dlon[i])
+                & np.isin(origins, self.connectivity_neighbours[i])
+            )
+            if not candidates.any():
+                continue
+            num_candidates = candidates.sum()
+            dists = self.connectivity_geod.inv(
+                np.full(num_candidates, lon),
+                np.full(num_candidates, lat),
+                lons[candidates],
+                lats[candidates],
+            )[2]
+            self.connectivity_hits[i, idx[candidates]] |= (
+                dists < self.connectivity_min_dist
+            )
+
+    def get_connectivity(self, particles_per_site=100):
+        """Return connectivity matrix in %, same layout as the file based calculation"""
+        site_index = pd.Index(self.connectivity_site_ids, name="localityNo")
+        df_connect = pd.DataFrame(0.0, index=site_index, columns=site_index)
+        for i, locality_id in enumerate(self.connectivity_site_ids):
+            counts = pd.Series(
+                self.connectivity_origin[self.connectivity_hits[i]]
+            ).value_counts()
+            df_connect.loc[locality_id, counts.index] += counts.values
+
+        # Normalize (convert to %)
+        df_connect = 100 * df_connect / particles_per_site
+
+        return df_connect
+
+
+class RegionalLandmaskReader(ContinuousReader):
+    """Landmask reader backed by a precomputed raster of the sites' region
+
+    Lookups within the region are a single array index per element. Elements that leave
+    the region are checked against the global GSHHG landmask, which is only loaded if
+    that happens.
+    """
+
+    name = "regional_landmask"
+    variables = ["land_binary_mask"]
+    proj4 = None
+    crs = None
+
+    def __init__(self, filename):
+        self.proj4 = "+proj=lonlat +ellps=WGS84"
+        self.crs = pyproj.CRS(self.proj4)
+
+        with xr.open_dataset(filename) as ds:
+            self.mask = ds["land_binary_mask"].values.astype(bool)
+            lons = ds["lon"].values
+            lats = ds["lat"].values
+        self.mask_dlon = lons[1] - lons[0]
+        self.mask_dlat = lats[1] - lats[0]
+        # Cell edges of the raster
+        self.mask_extent = (
+            lons[0] - self.mask_dlon / 2,
+            lats[0] - self.mask_dlat / 2,
+            lons[-1] + self.mask_dlon / 2,
+            lats[-1] + self.mask_dlat / 2,
+        )
+        self.global_mask = None
+
+        super().__init__()
+
+        self.z = None
+        # Global coverage, see above
+        self.xmin, self.ymin = -180, -90
+        self.xmax, self.ymax = 180, 90
+
+    def get_variables(self, requestedVariables, time=None, x=None, y=None, z=None):
+        self.check_arguments(requestedVariables, time, x, y, z)
+        x = self.modulate_longitude(np.asarray(x, dtype=np.float64))
+        y = np.asarray(y, dtype=np.float64)
+        lonmin, latmin, lonmax, latmax = self.mask_extent
+        inside = (x >= lonmin) & (x < lonmax) & (y >= latmin) & (y < latmax)
+
+        land = np.zeros(x.shape, dtype=bool)
+        i = ((y[inside] - latmin) / self.mask_dlat).astype(np.int64)
+        j = ((x[inside] - lonmin) / self.mask_dlon).astype(np.int64)
+        land[inside] = self.mask[
+            np.minimum(i, self.mask.shape[0] - 1), np.minimum(j, self.mask.shape[1] - 1)
+        ]
+        if not inside.all():
+            if self.global_mask is None:
+                print("Elements left the landmask region, loading global landmask")
+                self.global_mask = reader_global_landmask.get_mask()
+            land[~inside] = self.global_mask.contains_many(x[~inside], y[~inside])
+        return {"land_binary_mask": land}
+
+
+def _landmask_region(df_locs, margin_km):
+    """Bounding box (lonmin, latmin, lonmax, latmax) of the sites plus a margin
+
+    Rounded outwards to 0.1 degrees, so small changes to the site list reuse the cache.
+    """
+    margin_lat = margin_km / 111.0
+    margin_lon = margin_lat / np.cos(np.deg2rad(df_locs["lat"].abs().max()))
+    return (
+        np.floor(10 * (df_locs["lon"].min() - margin_lon)) / 10,
+        np.floor(10 * (df_locs["lat"].min() - margin_lat)) / 10,
+        np.ceil(10 * (df_locs["lon"].max() + margin_lon)) / 10,
+        np.ceil(10 * (df_locs["lat"].max() + margin_lat)) / 10,
+    )
+
+
+def prepare_regional_landmask(
+    df_locs, resolution_meters=50, margin_km=20, cache_dir="modeloutput/landmask"
+) -> str:
+    """Rasterize the GSHHG landmask for the sites' region, return the (cached) file
+
+    The raster is sampled from OpenDrift's global landmask at the cell centres, with
+    cells of at most `resolution_meters` in both directions at the centre of the region.
+    """
+    lonmin, latmin, lonmax, latmax = _landmask_region(df_locs, margin_km)
+    filename = os.path.join(
+        cache_dir,
+        f"landmask_{lonmin:.1f}_{latmin:.1f}_{lonmax:.1f}_{latmax:.1f}"
+        f"_{resolution_meters}m.nc",
+    )
+    if os.path.exists(filename):
+        print(f"Using cached landmask {filename}")
+        return filename
+
+    # Whole number of cells spanning the region exactly (cells at most the resolution)
+    dlat = resolution_meters / 111e3
+    dlon = dlat / np.cos(np.deg2rad((latmin + latmax) / 2))
+    nlon = int(np.ceil(round((lonmax - lonmin) / dlon, 6)))
+    nlat = int(np.ceil(round((latmax - latmin) / dlat, 6)))
+    lons = np.linspace(lonmin, lonmax, 2 * nlon + 1)[1::2]
+    lats = np.linspace(latmin, latmax, 2 * nlat + 1)[1::2]
+    print(f"Rasterizing landmask {filename} ({len(lats)} x {len(lons)} cells)")
+
+    global_mask = reader_global_landmask.get_mask()
+    mask = np.zeros((len(lats), len(lons)), dtype=np.uint8)
+    for i, lat in enumerate(tqdm(lats)):
+        mask[i] = global_mask.contains_many(lons, np.full(len(lons), lat))
+
+    ds = xr.Dataset(
+        {
+            "land_binary_mask": (
+                ("lat", "lon"),
+                mask,
+                {"standard_name": "land_binary_mask", "units": "1"},
+            )
+        },
+        coords={
+            "lon": ("lon", lons, {"standard_name": "longitude"}),
+            "lat": ("lat", lats, {"standard_name": "latitude"}),
+        },
+        attrs={
+            "source": "GSHHG (OpenDrift global landmask)",
+            "resolution_meters": resolution_meters,
+        },
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first, so an interrupted run does not leave a bad cache
+    ds.to_netcdf(
+        filename + ".tmp",
+        encoding={"land_binary_mask": {"zlib": True, "complevel": 1}},
+    )
+    os.replace(filename + ".tmp", filename)
+    return filename
+
+
+def run_opendrift(
+    config, df_locs, starttime, df_dists=None, connectivity=None, landmask_file=None
+):
+    """Run OpenDrift forecast from all localities
+
+    If a `connectivity` config is given, connectivity is accumulated during the run and the
+    connectivity matrix is returned. Trajectories are then only written if an output file is
+    configured. If a `landmask_file` is given (cf. `prepare_regional_landmask`), it is used
+    instead of the global landmask.
+    """
 
     # Initialize opendrift model
-    o = OceanDrift(
-        loglevel=OPENDRIFT_LOGLEVEL
-    )  # Set loglevel to 0 for debug information
+    if connectivity is None:
+        o = OceanDrift(
+            loglevel=OPENDRIFT_LOGLEVEL
+        )  # Set loglevel to 0 for debug information
+    else:
+        o = ConnectivityOceanDrift(
+            df_locs,
+            df_dists,
+            min_dist=connectivity["radius"],
+            num_sites=connectivity["number_of_neighbours"],
+            loglevel=OPENDRIFT_LOGLEVEL,
+        )
 
     # Norkyst ocean model for current
     norkyst_agg = "https://thredds.met.no/thredds/dodsC/sea/norkyst800m/1h/aggregate_be"
@@ -84,6 +369,10 @@ def run_opendrift(config, df_locs, starttime):
     o.set_config("environment:fallback:y_sea_water_velocity", 0)
     o.set_config("drift:horizontal_diffusivity", 1)
     o.set_config("general:coastline_action", "previous")
+    if landmask_file is not None:
+        # Otherwise OpenDrift replaces any landmask reader by the global landmask
+        o.set_config("general:use_auto_landmask", False)
+        o.add_reader(RegionalLandmaskReader(landmask_file))
 
     # Seed at all localities
     for _, row in df_locs.iterrows():
@@ -99,13 +388,24 @@ def run_opendrift(config, df_locs, starttime):
         )
 
     # Run model
+    duration = timedelta(hours=config["simulation_duration_hours"])
+    if config["output_file"]:
+        time_step_output = config["time_step_output"]
+    else:
+        # No trajectories wanted, keep only first and last step in memory
+        time_step_output = duration
     o.run(
-        duration=timedelta(hours=config["simulation_duration_hours"]),
+        duration=duration,
         time_step=600,
-        time_step_output=600,
-        outfile=config["output_file"],
+        time_step_output=time_step_output,
+        outfile=config["output_file"] or None,
     )
 
+    if connectivity is not None:
+        # Positions after the last update have not been seen yet
+        o.accumulate_connectivity()
+        return o.get_connectivity(particles_per_site=config["particles_per_site"])
+
 
 def calculate_distance_connectivity_nearest(
     ncfile, df_sites, df_dists, min_dist, num_sites=10, particles_per_site=100
@@ -170,7 +470,88 @@ def _replace_headers_in_connectivity_dataframe_num2name(
     return dfx
 
 
-def _upload_trajectories_to_s3(output_file_netcdf: str, output_file_s3: str) -> None:
+def _zarr_compressor_encoding() -> Dict:
+    """Blosc/Zstd with byte shuffle, for zarr v2 or v3 stores"""
+    import zarr
+
+    if int(zarr.__version__.split(".")[0]) >= 3:
+        from zarr.codecs import BloscCodec
+
+        return {"compressors": [BloscCodec(cname="zstd", clevel=5, shuffle="shuffle")]}
+    from numcodecs import Blosc
+
+    return {"compressor": Blosc(cname="zstd", clevel=5, shuffle=Blosc.SHUFFLE)}
+
+
+def _compact_integer_dtype(da: xr.DataArray, fill_value: int = -1) -> str:
+    """Smallest signed integer type that holds all values of `da` and the fill value"""
+    vmin = min(float(da.min()), fill_value)
+    vmax = max(float(da.max()), fill_value)
+    for dtype in ["int8", "int16", "int32"]:
+        info = np.iinfo(dtype)
+        if info.min <= vmin and vmax <= info.max:
+            return dtype
+    return "int64"
+
+
+def _compact_trajectory_encoding(ds: xr.Dataset) -> Dict:
+    """Compact encoding for the trajectory dataset
+
+    lon/lat are stored as fixed point integers with TRAJECTORY_LONLAT_SCALE_FACTOR degrees
+    resolution (max. error of half a step, i.e. ~0.6 m in latitude), status and
+    origin_marker as the smallest integer type that fits, and all variables are compressed.
+    The precision loss is recorded in the dataset attributes. Modifies `ds` in place.
+    """
+    compressor = _zarr_compressor_encoding()
+    encoding = {}
+    for name in ds.data_vars:
+        ds[name].encoding = {}
+        encoding[name] = dict(compressor)
+    for name in ["lon", "lat"]:
+        # OpenDrift writes float32, scaled in float32 the error would be up to ~1e-5
+        ds[name] = ds[name].astype("float64")
+        encoding[name].update(
+            {
+                "dtype": "int32",
+                "scale_factor": TRAJECTORY_LONLAT_SCALE_FACTOR,
+                "add_offset": 0.0,
+                "_FillValue": np.iinfo("int32").min,
+            }
+        )
+        ds[name].attrs["quantization_step_degrees"] = TRAJECTORY_LONLAT_SCALE_FACTOR
+        ds[name].attrs["quantization_max_abs_error_degrees"] = (
+            TRAJECTORY_LONLAT_SCALE_FACTOR / 2
+        )
+    for name in ["status", "origin_marker"]:
+        if name in ds.data_vars:
+            encoding[name].update(
+                {"dtype": _compact_integer_dtype(ds[name]), "_FillValue": -1}
+            )
+    ds.attrs["trajectory_encoding"] = (
+        "compact: lon/lat quantized to %g degrees (max. abs. error %g degrees), "
+        "status/origin_marker as compact integers, Blosc/Zstd with shuffle"
+        % (TRAJECTORY_LONLAT_SCALE_FACTOR, TRAJECTORY_LONLAT_SCALE_FACTOR / 2)
+    )
+    return encoding
+
+
+def _write_trajectories_zarr(
+    ds_trajectories: xr.Dataset, store, encoding: str = "default"
+) -> None:
+    """Write trajectories to a zarr store, `encoding` is either 'default' or 'compact'"""
+    if encoding == "compact":
+        ds_trajectories = ds_trajectories.copy()
+        zarr_encoding = _compact_trajectory_encoding(ds_trajectories)
+    elif encoding == "default":
+        zarr_encoding = None
+    else:
+        raise ValueError(f"Unknown trajectory encoding '{encoding}'")
+    ds_trajectories.to_zarr(store, compute=True, mode="w", encoding=zarr_encoding)
+
+
+def _upload_trajectories_to_s3(
+    output_file_netcdf: str, output_file_s3: str, encoding: str = "default"
+) -> None:
     print("*** Uploading Trajectories to S3")
     print(f"Opening '{output_file_netcdf}...")
     ds_trajectories = xr.open_dataset(output_file_netcdf)
@@ -187,7 +568,7 @@ def _upload_trajectories_to_s3(output_file_netcdf: str, output_file_s3: str) ->
     mapper = fs.get_mapper(output_file_s3)
     # !!! here be dragons ~ https://github.com/fsspec/s3fs/issues/931
     try:
-        ds_trajectories.to_zarr(mapper, compute=True, mode="w")
+        _write_trajectories_zarr(ds_trajectories, mapper, encoding=encoding)
         print("*** Done Uploading Trajectories to S3")
     except Exception as e:
         print(f"Upload error: {e}")
@@ -211,6 +592,75 @@ def _upload_connectivity_to_s3(output_file_local: str, output_file_s3: str) -> N
     pass
 
 
+def _archive_partition(starttime: datetime) -> str:
+    """Relative path of the archive file for a run, partitioned by run date"""
+    return f"run_date={starttime:%Y-%m-%d}/{starttime:%Y%m%dT%H%M%S}.parquet"
+
+
+def _archive_connectivity(
+    df_connectivity: pd.DataFrame, starttime: datetime, archive_dir: str
+) -> str:
+    """Write connectivity of this run to the archive in long format (non-zero values only)
+
+    df_connectivity must have localityNo as headers, with receiving sites as index and
+    source sites as columns. Returns the path relative to `archive_dir`.
+    """
+    df_long = (
+        df_connectivity.rename_axis(index="receiver", columns="source")
+        .stack()
+        .rename("connectivity")
+        .reset_index()
+    )
+    df_long = df_long[df_long["connectivity"] > 0].astype(
+        {"receiver": "int32", "source": "int32", "connectivity": "float32"}
+    )
+    df_long.insert(0, "start_time", pd.Timestamp(starttime))
+    path = "connectivity/" + _archive_partition(starttime)
+    os.makedirs(os.path.dirname(os.path.join(archive_dir, path)), exist_ok=True)
+    df_long.to_parquet(os.path.join(archive_dir, path), index=False)
+    return path
+
+
+def _archive_tracks(
+    output_file_netcdf: str,
+    starttime: datetime,
+    archive_dir: str,
+    interval_seconds: int = 3600,
+) -> str:
+    """Write decimated trajectories of this run to the archive (active elements only)
+
+    Returns the path relative to `archive_dir`.
+    """
+    with xr.open_dataset(output_file_netcdf) as ds:
+        step = 1
+        if ds.time.size > 1:
+            dt = (ds.time.values[1] - ds.time.values[0]) / np.timedelta64(1, "s")
+            step = max(1, int(round(interval_seconds / dt)))
+        df_tracks = (
+            ds[["lon", "lat", "origin_marker", "status"]]
+            .isel(time=slice(None, None, step))
+            .to_dataframe()
+            .reset_index()
+        )
+    df_tracks = (
+        df_tracks[df_tracks["status"] == 0]
+        .drop(columns="status")
+        .astype(
+            {
+                "trajectory": "int32",
+                "lon": "float32",
+                "lat": "float32",
+                "origin_marker": "int32",
+            }
+        )
+    )
+    df_tracks.insert(0, "start_time", pd.Timestamp(starttime))
+    path = "tracks/" + _archive_partition(starttime)
+    os.makedirs(os.path.dirname(os.path.join(archive_dir, path)), exist_ok=True)
+    df_tracks.to_parquet(os.path.join(archive_dir, path), index=False)
+    return path
+
+
 @click.command()
 @click.option(
     "--starttime",
@@ -227,32 +677,75 @@ def run(starttime):
     df_locs = pd.read_excel(config["sitedata"]["site_file"])
     df_dists = pd.read_excel(config["sitedata"]["sites_distances_file"], index_col=0)
 
+    # (opt) rasterize the landmask of the sites' region once, reused by later runs
+    landmask_file = None
+    if config["landmask"]["regional"]:
+        landmask_file = prepare_regional_landmask(
+            df_locs,
+            resolution_meters=config["landmask"]["resolution_meters"],
+            margin_km=config["landmask"]["margin_km"],
+            cache_dir=config["landmask"]["cache_dir"],
+        )
+
     print(f"Running model, start time: {starttime}")
-    run_opendrift(config["opendrift"], df_locs, starttime)
-
-    # Calculate and store connectivity matrix
-    print("Calculate connectivity matrix")
-    # df_connect = calculate_simple_connectivity(OUTFILE, df_locs)
-    df_connect = calculate_distance_connectivity_nearest(
-        config["opendrift"]["output_file"],
-        df_locs,
-        df_dists,
-        min_dist=config["connectivity"]["radius"],
-        num_sites=config["connectivity"]["number_of_neighbours"],
-        particles_per_site=config["opendrift"]["particles_per_site"],
-    )
+    if config["connectivity"]["inline"]:
+        # Connectivity is accumulated during the run
+        df_connect = run_opendrift(
+            config["opendrift"],
+            df_locs,
+            starttime,
+            df_dists=df_dists,
+            connectivity=config["connectivity"],
+            landmask_file=landmask_file,
+        )
+    else:
+        run_opendrift(
+            config["opendrift"], df_locs, starttime, landmask_file=landmask_file
+        )
+
+        # Calculate and store connectivity matrix
+        print("Calculate connectivity matrix")
+        # df_connect = calculate_simple_connectivity(OUTFILE, df_locs)
+        df_connect = calculate_distance_connectivity_nearest(
+            config["opendrift"]["output_file"],
+            df_locs,
+            df_dists,
+            min_dist=config["connectivity"]["radius"],
+            num_sites=config["connectivity"]["number_of_neighbours"],
+            particles_per_site=config["opendrift"]["particles_per_site"],
+        )
     # (opt) write a connectivity matrix that has localityNo instead of site names as headers
     if "output_file_withLocalityId" in config["connectivity"].keys():
         df_connect.to_excel(config["connectivity"]["output_file_withLocalityId"])
+    # (opt) keep this run in the date-partitioned archive
+    archive_paths = []
+    if config["archive"]["output_s3"] is not None:
+        archive_paths.append(
+            _archive_connectivity(
+                df_connect, starttime, config["archive"]["output_dir"]
+            )
+        )
+        if config["archive"]["tracks"] and config["opendrift"]["output_file"]:
+            archive_paths.append(
+                _archive_tracks(
+                    config["opendrift"]["output_file"],
+                    starttime,
+                    config["archive"]["output_dir"],
+                    interval_seconds=config["archive"]["tracks_interval_seconds"],
+                )
+            )
     df_connect = _replace_headers_in_connectivity_dataframe_num2name(
         df_connect, df_locs
     )
     df_connect.to_excel(config["connectivity"]["output_file"])
 
     # upload trajectories to edito/minio
-    _upload_trajectories_to_s3(
-        config["opendrift"]["output_file"], config["opendrift"]["output_file_s3"]
-    )
+    if config["opendrift"]["output_file"]:
+        _upload_trajectories_to_s3(
+            config["opendrift"]["output_file"],
+            config["opendrift"]["output_file_s3"],
+            encoding=config["opendrift"]["output_encoding"],
+        )
 
     # upload connectivity files to edito/minio
     _upload_connectivity_to_s3(
@@ -264,6 +757,13 @@ def run(starttime):
             config["connectivity"]["output_file_withLocalityId_s3"],
         )
 
+    # upload archive files to edito/minio
+    for path in archive_paths:
+        _upload_connectivity_to_s3(
+            os.path.join(config["archive"]["output_dir"], path),
+            "%s/%s" % (config["archive"]["output_s3"], path),
+        )
+
     print("--- ALL DONE ---")
 
 
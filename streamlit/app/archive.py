@@ -0,0 +1,179 @@
+"""DuckDB queries on the connectivity archive written by opendrift/runnorkystforecast.py
+
+One Parquet file per run in {archive}/connectivity/run_date=YYYY-MM-DD/, with the columns
+start_time, receiver, source and connectivity (%). Queries filter on run_date, so only
+the files of the requested days are read.
+"""
+
+import datetime
+import os
+
+import click
+import duckdb
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
+AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+AWS_SESSION_TOKEN = os.getenv("AWS_SESSION_TOKEN")
+AWS_S3_ENDPOINT = os.getenv("AWS_S3_ENDPOINT")
+AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION")
+AWS_BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
+
+AQUA_ARCHIVE_S3 = os.getenv("AQUA_ARCHIVE_S3")
+
+
+def get_archive_url():
+    """S3 URL of the archive, or None if no archive is configured"""
+    if not AQUA_ARCHIVE_S3:
+        return None
+    return f"s3://{AWS_BUCKET_NAME}/{AQUA_ARCHIVE_S3}"
+
+
+def _sql_string(value):
+    """Quote value as SQL string literal (CREATE SECRET does not support parameters)"""
+    return "'%s'" % (value or "").replace("'", "''")
+
+
+def connect():
+    """DuckDB connection that can read the archive from S3
+
+    A connection must not be used by several threads at the same time, use `.cursor()`
+    to get a connection per thread.
+    """
+    con = duckdb.connect()
+    con.execute("INSTALL httpfs")
+    con.execute("LOAD httpfs")
+    con.execute(f"""
+        CREATE SECRET archive (
+            TYPE S3,
+            KEY_ID {_sql_string(AWS_ACCESS_KEY_ID)},
+            SECRET {_sql_string(AWS_SECRET_ACCESS_KEY)},
+            SESSION_TOKEN {_sql_string(AWS_SESSION_TOKEN)},
+            ENDPOINT {_sql_string(AWS_S3_ENDPOINT)},
+            REGION {_sql_string(AWS_DEFAULT_REGION)},
+            URL_STYLE 'path'
+        )
+        """)
+    return con
+
+
+def _connectivity_files(archive_url):
+    return f"read_parquet('{archive_url}/connectivity/*/*.parquet', hive_partitioning = true)"
+
+
+def _since(days):
+    return datetime.date.today() - datetime.timedelta(days=days)
+
+
+def get_runs(con, archive_url, days=30):
+    """Start times of all archived runs in the last N days, oldest first"""
+    return (
+        con.execute(
+            f"""
+            SELECT DISTINCT start_time
+            FROM {_connectivity_files(archive_url)}
+            WHERE run_date >= ?
+            ORDER BY start_time
+            """,
+            [_since(days)],
+        )
+        .df()["start_time"]
+        .tolist()
+    )
+
+
+def get_connectivity_matrix(con, archive_url, start_time):
+    """Connectivity matrix of one run, receiving sites as index and sources as columns"""
+    start_time = pd.Timestamp(start_time)
+    df_long = con.execute(
+        f"""
+        SELECT receiver, source, connectivity
+        FROM {_connectivity_files(archive_url)}
+        WHERE run_date = ? AND start_time = ?
+        """,
+        [start_time.date(), start_time.to_pydatetime()],
+    ).df()
+    return df_long.pivot(index="receiver", columns="source", values="connectivity")
+
+
+def get_connectivity_timeseries(con, archive_url, source, receiver, days=30):
+    """Connectivity from site `source` to site `receiver` for every run in the last N days"""
+    return con.execute(
+        f"""
+        WITH runs AS (
+            SELECT DISTINCT start_time
+            FROM {_connectivity_files(archive_url)}
+            WHERE run_date >= ?
+        ), hits AS (
+            SELECT start_time, connectivity
+            FROM {_connectivity_files(archive_url)}
+            WHERE run_date >= ? AND source = ? AND receiver = ?
+        )
+        SELECT runs.start_time, coalesce(hits.connectivity, 0) AS connectivity
+        FROM runs LEFT JOIN hits USING (start_time)
+        ORDER BY runs.start_time
+        """,
+        [_since(days), _since(days), source, receiver],
+    ).df()
+
+
+def get_top_receivers(con, archive_url, source, days=30, limit=10):
+    """Sites that receive most from site `source`, averaged over all runs in the last N days"""
+    return con.execute(
+        f"""
+        WITH runs AS (
+            SELECT count(DISTINCT start_time) AS num_runs
+            FROM {_connectivity_files(archive_url)}
+            WHERE run_date >= ?
+        )
+        SELECT
+            receiver,
+            sum(connectivity) / any_value(runs.num_runs) AS mean_connectivity,
+            max(connectivity) AS max_connectivity,
+            count(*) AS num_runs_connected
+        FROM {_connectivity_files(archive_url)}, runs
+        WHERE run_date >= ? AND source = ? AND receiver != source
+        GROUP BY receiver
+        ORDER BY mean_connectivity DESC
+        LIMIT ?
+        """,
+        [_since(days), _since(days), source, limit],
+    ).df()
+
+
+@click.group()
+def cli():
+    """Query the connectivity archive"""
+
+
+@cli.command()
+@click.argument("source", type=int)
+@click.argument("receiver", type=int)
+@click.option("--days", default=30, help="Number of days to look back")
+def timeseries(source, receiver, days):
+    """Connectivity from SOURCE to RECEIVER (localityNo) over the last N days"""
+    print(
+        get_connectivity_timeseries(
+            connect(), get_archive_url(), source, receiver, days=days
+        ).to_string(index=False)
+    )
+
+
+@cli.command()
+@click.argument("source", type=int)
+@click.option("--days", default=30, help="Number of days to look back")
+@click.option("--limit", default=10, help="Number of receivers to list")
+def top_receivers(source, days, limit):
+    """Top receivers of SOURCE (localityNo) over the last N days"""
+    print(
+        get_top_receivers(
+            connect(), get_archive_url(), source, days=days, limit=limit
+        ).to_string(index=False)
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,427 @@
+import asyncio
+import datetime
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+from io import BytesIO
+from unittest import mock
+
+import click
+import numpy as np
+import pandas as pd
+import psutil
+import requests
+import xarray as xr
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "main.py")
+FINISHED_OK = [
+    ForwardMsg.FINISHED_SUCCESSFULLY,
+    ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+]
+
+
+class Backends:
+    """Mocked BarentsWatch, Minio and S3 backends with synthetic data and call counts"""
+
+    def __init__(self, workdir, num_sites, particles_per_site, num_steps, latency):
+        self.latency = latency
+        self.calls = Counter()
+        self.calls_file = os.path.join(workdir, "calls.json")
+        with open(self.calls_file, "w") as f:
+            json.dump(self.calls, f)
+        self._lock = threading.Lock()
+        rng = np.random.default_rng(0)
+
+        # Sites around Frohavet, Mid-Norway, the first is the default site of the app
+        self.site_ids = np.arange(30560, 30560 + num_sites)
+        self.site_names = ["Tristeinen"] + [f"Site {i}" for i in self.site_ids[1:]]
+        lons = 8.5 + rng.normal(0, 0.3, num_sites)
+        lats = 63.8 + rng.normal(0, 0.15, num_sites)
+        self.site_file = os.path.join(workdir, "sites.xlsx")
+        pd.DataFrame(
+            {
+                "localityNo": self.site_ids,
+                "name": self.site_names,
+                "lon": lons,
+                "lat": lats,
+            }
+        ).to_excel(self.site_file)
+
+        dists = 111e3 * np.hypot(
+            (lons[:, None] - lons[None, :]) * np.cos(np.deg2rad(63.8)),
+            lats[:, None] - lats[None, :],
+        )
+        self.distances_file = os.path.join(workdir, "distances.xlsx")
+        pd.DataFrame(dists, index=self.site_ids, columns=self.site_ids).to_excel(
+            self.distances_file
+        )
+
+        df_connect = pd.DataFrame(
+            np.where(dists < 10e3, rng.uniform(0, 100, dists.shape), 0),
+            index=pd.Index(self.site_ids, name="localityNo"),
+            columns=pd.Index(self.site_ids, name="localityNo"),
+        )
+        buffer = BytesIO()
+        df_connect.to_excel(buffer)
+        self.connectivity_bytes = buffer.getvalue()
+
+        num_trajectories = num_sites * particles_per_site
+        origins = np.repeat(self.site_ids, particles_per_site)
+        steps = rng.normal(0, 0.002, (num_trajectories, num_steps, 2)).cumsum(axis=1)
+        self.ds_trajectories = xr.Dataset(
+            {
+                "lon": (
+                    ("trajectory", "time"),
+                    np.repeat(lons, particles_per_site)[:, None] + steps[:, :, 0],
+                ),
+                "lat": (
+                    ("trajectory", "time"),
+                    np.repeat(lats, particles_per_site)[:, None] + steps[:, :, 1],
+                ),
+                "status": (("trajectory", "time"), np.zeros(steps.shape[:2])),
+                "origin_marker": (
+                    ("trajectory", "time"),
+                    np.repeat(origins[:, None], num_steps, axis=1),
+                ),
+            },
+            coords={
+                "time": pd.date_range(
+                    datetime.datetime.now().replace(microsecond=0),
+                    periods=num_steps,
+                    freq="10min",
+                )
+            },
+        )
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            with open(self.calls_file, "w") as f:
+                json.dump(self.calls, f)
+        time.sleep(self.latency)
+
+    def _response(self, payload):
+        response = mock.Mock(ok=True)
+        response.json.return_value = payload
+        return response
+
+    def requests_post(self, url, *args, **kwargs):
+        self._call("barentswatch token")
+        return self._response({"access_token": "token"})
+
+    def requests_get(self, url, *args, **kwargs):
+        self._call("barentswatch data")
+        weeks = range(1, 53)
+        if url.endswith("seatemperature/2023"):
+            return self._response(
+                {
+                    "data": [
+                        {"week": w, "seaTemperature": 8 + 4 * np.sin(w / 8)}
+                        for w in weeks
+                    ]
+                }
+            )
+        if url.endswith("avgfemalelice/2023"):
+            return self._response(
+                {
+                    "type": "avgAdultFemaleLice",
+                    "data": [
+                        {"week": w, "value": 0.2 + 0.1 * np.cos(w / 5)} for w in weeks
+                    ],
+                }
+            )
+        if re.search(r"/locality/\d+/\d+$", url):
+            return self._response(
+                {
+                    "localities": [
+                        {
+                            "localityNo": int(i),
+                            "name": name,
+                            "isFallow": bool(i % 5 == 0),
+                        }
+                        for i, name in zip(self.site_ids, self.site_names)
+                    ]
+                }
+            )
+        raise requests.ConnectionError(f"Not mocked: {url}")
+
+    def minio(self, *args, **kwargs):
+        client = mock.Mock()
+        client.list_buckets.side_effect = lambda: self._call("minio list_buckets")
+
+        def get_object(bucket_name, object_name):
+            self._call("minio get_object")
+            return mock.Mock(data=self.connectivity_bytes)
+
+        client.get_object.side_effect = get_object
+        return client
+
+    def fsspec_filesystem(self, *args, **kwargs):
+        fs = mock.Mock()
+
+        def info(path):
+            self._call("s3 info")
+            return {"ETag": "version-1"}
+
+        fs.info.side_effect = info
+        return fs
+
+    def open_dataset(self, filename, *args, **kwargs):
+        self._call("zarr open")
+        return self.ds_trajectories.copy()
+
+    def patches(self, workdir):
+        env = {
+            "AQUA_SITE_FILE": self.site_file,
+            "AQUA_SITE_DISTANCES_FILES": self.distances_file,
+            "AWS_BUCKET_NAME": "bucket",
+            "AQUA_CONNECTIVITY_FILE_WITH_LOCALITY_ID_S3": "connectivity.xlsx",
+            "AQUA_OPENDRIFT_OUTPUT_FILE_S3": "trajectories.zarr",
+            "AQUA_ZARR_CACHE_DIR": os.path.join(workdir, "zarr-cache"),
+        }
+        return [
+            mock.patch.dict(os.environ, env),
+            mock.patch("requests.post", self.requests_post),
+            mock.patch("requests.get", self.requests_get),
+            mock.patch("minio.Minio", self.minio),
+            mock.patch("fsspec.filesystem", self.fsspec_filesystem),
+            mock.patch("xarray.open_dataset", self.open_dataset),
+        ]
+
+
+async def _rerun(ws, widgets=(), timeout=120):
+    """Request a rerun, wait until the script has finished, return seconds and selectbox"""
+    back_msg = BackMsg()
+    back_msg.rerun_script.query_string = ""
+    back_msg.rerun_script.widget_states.widgets.extend(widgets)
+    start = time.perf_counter()
+    await ws.write_message(back_msg.SerializeToString(), binary=True)
+    selectbox = None
+    while True:
+        payload = await asyncio.wait_for(ws.read_message(), timeout)
+        if payload is None:
+            raise RuntimeError("Connection closed by the server")
+        msg = ForwardMsg()
+        msg.ParseFromString(payload)
+        if msg.WhichOneof("type") == "delta":
+            element = msg.delta.new_element
+            if element.WhichOneof("type") == "selectbox":
+                selectbox = element.selectbox
+            elif element.WhichOneof("type") == "exception":
+                raise RuntimeError(element.exception.message)
+        elif msg.WhichOneof("type") == "script_finished":
+            if msg.script_finished in FINISHED_OK:
+                return time.perf_counter() - start, selectbox
+            raise RuntimeError(f"Script finished with status {msg.script_finished}")
+
+
+class Session:
+    """A browser session: opens the page, then switches between random sites"""
+
+    def __init__(self, url, seed, timeout):
+        self.url = url
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        self.latencies = []
+
+    async def first_load(self, kind="first load"):
+        self.ws = await websocket_connect(self.url, subprotocols=["streamlit"])
+        seconds, self.selectbox = await _rerun(self.ws, timeout=self.timeout)
+        self.latencies.append((kind, seconds))
+
+    async def switch_sites(self, num_reruns):
+        for _ in range(num_reruns):
+            widget = WidgetState(
+                id=self.selectbox.id,
+                int_value=self.rng.randrange(len(self.selectbox.options)),
+            )
+            seconds, _ = await _rerun(self.ws, [widget], timeout=self.timeout)
+            self.latencies.append(("site switch", seconds))
+
+    def close(self):
+        if hasattr(self, "ws"):
+            self.ws.close()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited")
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/_stcore/health"):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("Server did not start")
+
+
+async def _load_test(port, num_sessions, num_reruns, timeout, measure):
+    """Run a cold first session, then all sessions at the same time, return latencies
+
+    `measure(name)` is called after the first session has loaded and when all sessions
+    are done, while all sessions are still connected.
+    """
+    url = f"ws://localhost:{port}/_stcore/stream"
+    sessions = [Session(url, seed, timeout) for seed in range(num_sessions)]
+    await sessions[0].first_load("first load (cold)")
+    measure("first")
+
+    async def run_session(session):
+        if session is not sessions[0]:
+            await session.first_load()
+        await session.switch_sites(num_reruns)
+
+    try:
+        await asyncio.gather(*[run_session(session) for session in sessions])
+        measure("end")
+    finally:
+        for session in sessions:
+            session.close()
+    return [latency for session in sessions for latency in session.latencies]
+
+
+def data_options(f):
+    """Options for the synthetic data, shared by `run` and `serve`"""
+    f = click.option("--sites", default=40, help="Number of synthetic sites")(f)
+    f = click.option("--particles", default=20, help="Trajectories per site")(f)
+    f = click.option("--steps", default=145, help="Time steps per trajectory")(f)
+    f = click.option(
+        "--backend-latency-ms", default=50, help="Latency of every backend call"
+    )(f)
+    f = click.option(
+        "--app", default=APP_FILE, type=click.Path(exists=True), help="App to run"
+    )(f)
+    return f
+
+
+@click.group()
+def cli():
+    """Load test the dashboard with mocked backends"""
+
+
+@cli.command()
+@click.option("--port", default=8501, help="Port to listen on")
+@click.option("--workdir", default=None, help="Directory for the synthetic data")
+@data_options
+def serve(port, workdir, sites, particles, steps, backend_latency_ms, app):
+    """Run the app with mocked backends (e.g. to look at it in the browser)"""
+    from streamlit.web import bootstrap
+
+    workdir = workdir or tempfile.mkdtemp()
+    backends = Backends(workdir, sites, particles, steps, backend_latency_ms / 1000)
+    for patch in backends.patches(workdir):
+        patch.start()
+    flag_options = {
+        "server_port": port,
+        "server_address": "localhost",
+        "server_headless": True,
+        "server_fileWatcherType": "none",
+        "browser_gatherUsageStats": False,
+    }
+    bootstrap.load_config_options(flag_options)
+    bootstrap.run(app, False, [], flag_options)
+
+
+@cli.command()
+@click.option("--sessions", default=8, help="Number of concurrent sessions")
+@click.option("--reruns", default=10, help="Site switches per session")
+@click.option("--timeout", default=120, help="Timeout of a single rerun (seconds)")
+@data_options
+def run(sessions, reruns, timeout, sites, particles, steps, backend_latency_ms, app):
+    """Simulate concurrent browser sessions switching sites against a real app server"""
+    workdir = tempfile.mkdtemp()
+    port = _free_port()
+    log_file = os.path.join(workdir, "server.log")
+    with open(log_file, "w") as log:
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "serve",
+                f"--port={port}",
+                f"--workdir={workdir}",
+                f"--sites={sites}",
+                f"--particles={particles}",
+                f"--steps={steps}",
+                f"--backend-latency-ms={backend_latency_ms}",
+                f"--app={app}",
+            ],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    rss = {}
+    try:
+        _wait_for_server(port, server)
+        process = psutil.Process(server.pid)
+        rss["start"] = process.memory_info().rss
+
+        def measure(name):
+            rss[name] = process.memory_info().rss
+
+        start = time.perf_counter()
+        results = asyncio.run(_load_test(port, sessions, reruns, timeout, measure))
+        duration = time.perf_counter() - start
+    except Exception:
+        print(f"Load test failed, see server log {log_file}")
+        raise
+    finally:
+        server.terminate()
+        server.wait()
+    with open(os.path.join(workdir, "calls.json")) as f:
+        calls = json.load(f)
+
+    print(
+        f"{sessions} sessions x {reruns} site switches in {duration:.2f} s "
+        f"(backend latency {backend_latency_ms} ms)"
+    )
+    print(
+        f"{'rerun':<18}{'count':>8}{'p50 s':>10}{'p90 s':>10}{'p99 s':>10}{'max s':>10}"
+    )
+    for kind in ["first load (cold)", "first load", "site switch"]:
+        latencies = np.array([t for k, t in results if k == kind])
+        if len(latencies) == 0:
+            continue
+        print(
+            f"{kind:<18}{len(latencies):>8}"
+            f"{np.percentile(latencies, 50):>10.3f}"
+            f"{np.percentile(latencies, 90):>10.3f}"
+            f"{np.percentile(latencies, 99):>10.3f}"
+            f"{latencies.max():>10.3f}"
+        )
+    print("Server memory (RSS increase):")
+    print(
+        f"  {'first session':<22}{(rss['first'] - rss['start']) / 1e6:>6.1f} MB "
+        "(incl. process-wide caches)"
+    )
+    if sessions > 1:
+        print(
+            f"  {'per later session':<22}"
+            f"{(rss['end'] - rss['first']) / 1e6 / (sessions - 1):>6.1f} MB"
+        )
+    print("Backend calls:")
+    for name, count in sorted(calls.items()):
+        print(f"  {name:<22}{count:>6}")
+
+
+if __name__ == "__main__":
+    cli()